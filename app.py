@@ -1,19 +1,26 @@
-import io
 import uuid
+import math
 import random
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import string
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone, date
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import gspread
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 from googleapiclient.errors import HttpError
+
+if TYPE_CHECKING:
+    from email.message import Message
+
 # -------------------------------------------------------------------
 # CONFIG & CONSTANTS
 # -------------------------------------------------------------------
@@ -30,9 +37,9 @@ PAYCHECKS_SHEET = "paychecks"
 ITEMS_SHEET = "items"
 ARCHIVE_SHEET = "archive"
 
-PAYCHECKS_HEADERS = ["username", "pay1", "pay2", "pay3", "average"]
+PAYCHECKS_HEADERS = ("username", "pay1", "pay2", "pay3", "average")
 
-ITEMS_HEADERS = [
+ITEMS_HEADERS = (
     "id",
     "purchase_id",
     "timestamp",
@@ -47,17 +54,46 @@ ITEMS_HEADERS = [
     "paid",
     "paid_at",
     "paid_by",
-]
+)
 
-ARCHIVE_HEADERS = ITEMS_HEADERS + [
+ARCHIVE_HEADERS = ITEMS_HEADERS + (
     "approved",
     "approved_at",
     "approved_by",
-]
+)
 
 ITEMS_COL_INDEX = {name: idx + 1 for idx, name in enumerate(ITEMS_HEADERS)}
 ARCHIVE_COL_INDEX = {name: idx + 1 for idx, name in enumerate(ARCHIVE_HEADERS)}
 
+# A1 column letters, e.g. ARCHIVE_COL_LETTERS["approved"] == "O"
+ARCHIVE_COL_LETTERS = {
+    name: gspread.utils.rowcol_to_a1(1, col)[:-1] for name, col in ARCHIVE_COL_INDEX.items()
+}
+# Last column of a full paychecks row ("E")
+PAYCHECKS_LAST_COL_LETTER = gspread.utils.rowcol_to_a1(1, len(PAYCHECKS_HEADERS))[:-1]
+
+# Column selections for the history view. These stay lists: pandas treats a
+# tuple inside [] as a single key, not a selection.
+HISTORY_SOURCE_COLS = list(ITEMS_HEADERS)
+HISTORY_SOURCES = ["Active", "Archive"]
+HISTORY_TABLE_MAX_ROWS = 500
+
+# Read-only columns of the dashboard's Manage My Expenses grid
+MANAGE_EXPENSES_COLS = ["description", "amount_total", "debtors", "purchase_date", "timestamp"]
+HISTORY_DISPLAY_COLS = [
+    "source", "timestamp", "purchase_date", "uploader", "debtor",
+    "description", "amount_total", "amount_owed", "paid", "share_type",
+]
+
+# Read-only columns of the pending-payments editor on the approval page
+APPROVE_DISPLAY_COLS = [
+    "id", "debtor", "description", "amount_owed", "paid_by", "paid_at", "purchase_date",
+]
+
+# The paid_* and approved_* triplets are each written as one contiguous range
+assert ITEMS_COL_INDEX["paid_by"] - ITEMS_COL_INDEX["paid"] == 2
+assert ARCHIVE_COL_INDEX["approved_by"] - ARCHIVE_COL_INDEX["approved"] == 2
+
 # Random greetings and emojis
 GREETINGS = [
     "Welcome back, {name}! 🎉",
@@ -244,6 +280,35 @@ def get_random_emoji(emoji_list: List[str]) -> str:
     """Get a random emoji from a list."""
     return random.choice(emoji_list)
 
+# -------------------------------------------------------------------
+# BACKGROUND WORK
+# -------------------------------------------------------------------
+
+@st.cache_resource(show_spinner=False)
+def get_background_pool() -> ThreadPoolExecutor:
+    """
+    Process-wide worker pool. Cached as a resource because the script
+    re-executes on every rerun and would otherwise recreate it each time.
+    """
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="hm-bg")
+
+
+def run_in_background(fn, *args, **kwargs) -> Future:
+    """
+    Run fn on the shared worker pool and return its Future.
+
+    The current Streamlit script context is attached to the worker thread
+    so st.secrets / st.warning calls inside fn behave as on the main thread.
+    """
+    ctx = get_script_run_ctx()
+
+    def _task():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+
+    return get_background_pool().submit(_task)
+
+
 # -------------------------------------------------------------------
 # EMAIL NOTIFICATIONS
 # -------------------------------------------------------------------
@@ -252,58 +317,58 @@ def get_user_email(username: str) -> str:
     """Get the full email address for a username."""
     return f"{username}@gmail.com"
 
+@st.cache_data(show_spinner=False)
 def get_all_user_emails() -> List[str]:
     """Get email addresses for all users."""
-    users_cfg = st.secrets.get("users", {})
+    users_cfg = get_users_config()
     return [get_user_email(username) for username in users_cfg.keys()]
 
-def create_email_html(title: str, body_content: str, action_user: str) -> str:
-    """Create a beautiful HTML email template."""
-    return f"""
+# Full email page; only the title, body and action user vary per message
+EMAIL_TEMPLATE = string.Template("""
     <!DOCTYPE html>
     <html>
     <head>
         <style>
-            body {{
+            body {
                 font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
                 background-color: #f5f5f5;
                 margin: 0;
                 padding: 0;
-            }}
-            .container {{
+            }
+            .container {
                 max-width: 600px;
                 margin: 20px auto;
                 background-color: #ffffff;
                 border-radius: 10px;
                 box-shadow: 0 2px 10px rgba(0,0,0,0.1);
                 overflow: hidden;
-            }}
-            .header {{
+            }
+            .header {
                 background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                 color: white;
                 padding: 30px;
                 text-align: center;
-            }}
-            .header h1 {{
+            }
+            .header h1 {
                 margin: 0;
                 font-size: 28px;
-            }}
-            .content {{
+            }
+            .content {
                 padding: 30px;
                 color: #333;
-            }}
-            .content h2 {{
+            }
+            .content h2 {
                 color: #667eea;
                 margin-top: 0;
-            }}
-            .info-box {{
+            }
+            .info-box {
                 background-color: #f8f9fa;
                 border-left: 4px solid #667eea;
                 padding: 15px;
                 margin: 20px 0;
                 border-radius: 4px;
-            }}
-            .button {{
+            }
+            .button {
                 display: inline-block;
                 background-color: #667eea;
                 color: white;
@@ -311,29 +376,29 @@ def create_email_html(title: str, body_content: str, action_user: str) -> str:
                 text-decoration: none;
                 border-radius: 5px;
                 margin: 20px 0;
-            }}
-            .footer {{
+            }
+            .footer {
                 background-color: #f8f9fa;
                 color: #666;
                 text-align: center;
                 padding: 20px;
                 font-size: 12px;
-            }}
-            .emoji {{
+            }
+            .emoji {
                 font-size: 24px;
-            }}
+            }
         </style>
     </head>
     <body>
         <div class="container">
             <div class="header">
                 <h1>🏠 Household Manager</h1>
-                <p style="margin: 10px 0 0 0; opacity: 0.9;">{title}</p>
+                <p style="margin: 10px 0 0 0; opacity: 0.9;">${title}</p>
             </div>
             <div class="content">
-                {body_content}
+                ${body_content}
                 <p style="margin-top: 30px; color: #666;">
-                    <strong>Action by:</strong> {action_user}
+                    <strong>Action by:</strong> ${action_user}
                 </p>
             </div>
             <div class="footer">
@@ -343,7 +408,50 @@ def create_email_html(title: str, body_content: str, action_user: str) -> str:
         </div>
     </body>
     </html>
+    """)
+
+
+def create_email_html(title: str, body_content: str, action_user: str) -> str:
+    """Create a beautiful HTML email template."""
+    return EMAIL_TEMPLATE.substitute(
+        title=title, body_content=body_content, action_user=action_user
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_smtp_pool() -> Dict:
+    """Process-wide holder for one reusable, lock-protected SMTP connection."""
+    return {"lock": threading.Lock(), "server": None}
+
+
+def send_smtp_message(sender_email: str, sender_password: str, msg: "Message") -> None:
+    """
+    Send msg over the pooled Gmail connection, logging in on first use and
+    reconnecting once if the server dropped the idle connection.
     """
+    # Imported here: only the background email worker ever needs it
+    import smtplib
+
+    pool = get_smtp_pool()
+    with pool["lock"]:
+        for attempt in range(2):
+            if pool["server"] is None:
+                server = smtplib.SMTP_SSL('smtp.gmail.com', 465, timeout=30)
+                server.login(sender_email, sender_password)
+                pool["server"] = server
+            try:
+                pool["server"].send_message(msg)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                # Only a dead connection is worth a resend; SMTP-level errors
+                # (refused recipients, data errors) propagate as they are
+                try:
+                    pool["server"].close()
+                except OSError:
+                    pass
+                pool["server"] = None
+                if attempt:
+                    raise
+
 
 def send_email_notification(
     subject: str,
@@ -352,7 +460,12 @@ def send_email_notification(
     action_user: str,
     recipients: Optional[List[str]] = None
 ) -> None:
-    """Send email notification to users."""
+    """
+    Send email notification to users.
+
+    The message is built and sent on the background pool, so the page
+    doesn't wait for the SMTP round trip.
+    """
     try:
         sender_email = st.secrets["app"]["SENDER_EMAIL_ADDRESS"]
         sender_password = st.secrets["app"]["SENDER_EMAIL_PASSWORD"]
@@ -366,6 +479,26 @@ def send_email_notification(
     if not recipients:
         return
     
+    run_in_background(
+        _deliver_email, sender_email, sender_password,
+        subject, title, body_content, action_user, recipients,
+    )
+
+
+def _deliver_email(
+    sender_email: str,
+    sender_password: str,
+    subject: str,
+    title: str,
+    body_content: str,
+    action_user: str,
+    recipients: List[str],
+) -> None:
+    """Build and send one notification email; failures are only logged."""
+    # Imported here: only the background email worker ever needs these
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
     try:
         # Create message
         msg = MIMEMultipart('alternative')
@@ -378,10 +511,8 @@ def send_email_notification(
         html_part = MIMEText(html_content, 'html')
         msg.attach(html_part)
         
-        # Send email
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
+        # Send email over the shared connection
+        send_smtp_message(sender_email, sender_password, msg)
     except Exception as e:
         # Don't crash the app if email fails, just log it
         print(f"Failed to send email: {e}")
@@ -393,7 +524,7 @@ def notify_new_expense(
     affected_users: List[str]
 ) -> None:
     """Send notification when a new expense is added."""
-    users_cfg = st.secrets.get("users", {})
+    users_cfg = get_users_config()
     uploader_name = users_cfg.get(uploader, uploader)
     
     affected_names = [users_cfg.get(u, u) for u in affected_users]
@@ -422,7 +553,7 @@ def notify_multiple_expenses(
     affected_users: List[str]
 ) -> None:
     """Send notification when multiple expenses are added."""
-    users_cfg = st.secrets.get("users", {})
+    users_cfg = get_users_config()
     uploader_name = users_cfg.get(uploader, uploader)
     
     affected_names = [users_cfg.get(u, u) for u in affected_users]
@@ -464,7 +595,7 @@ def notify_payment_marked(
     amount: float
 ) -> None:
     """Send notification when a debt is marked as paid."""
-    users_cfg = st.secrets.get("users", {})
+    users_cfg = get_users_config()
     debtor_name = users_cfg.get(debtor, debtor)
     uploader_name = users_cfg.get(uploader, uploader)
     
@@ -488,6 +619,48 @@ def notify_payment_marked(
         recipients=[get_user_email(uploader)]
     )
 
+def notify_multiple_payments_marked(
+    debtor: str,
+    uploader: str,
+    payments: List[Dict]
+) -> None:
+    """Send one notification when several of an uploader's debts are marked as paid."""
+    users_cfg = get_users_config()
+    debtor_name = users_cfg.get(debtor, debtor)
+    uploader_name = users_cfg.get(uploader, uploader)
+    
+    total_all = sum(p['amount'] for p in payments)
+    
+    # Build payment list
+    payment_items = "".join(
+        f"<li><strong>{p['description']}</strong> - ${p['amount']:,.2f}</li>"
+        for p in payments
+    )
+    
+    body = f"""
+    <h2>✅ Payments Marked as Paid</h2>
+    <p>{debtor_name} has marked {len(payments)} payments as completed:</p>
+    <div class="info-box">
+        <ul style="margin: 10px 0;">
+            {payment_items}
+        </ul>
+        <p style="border-top: 2px solid #667eea; padding-top: 10px; margin-top: 10px;">
+            <strong>Total Amount:</strong> ${total_all:,.2f}
+        </p>
+        <p><strong>Awaiting approval from:</strong> {uploader_name}</p>
+    </div>
+    <p>{uploader_name}, please review and approve these payments.</p>
+    """
+    
+    # Send to uploader who needs to approve
+    send_email_notification(
+        subject=f"{len(payments)} Payments Pending Approval",
+        title="Payments Marked as Paid",
+        body_content=body,
+        action_user=debtor_name,
+        recipients=[get_user_email(uploader)]
+    )
+
 def notify_payment_approved(
     debtor: str,
     uploader: str,
@@ -495,7 +668,7 @@ def notify_payment_approved(
     amount: float
 ) -> None:
     """Send notification when a payment is approved."""
-    users_cfg = st.secrets.get("users", {})
+    users_cfg = get_users_config()
     debtor_name = users_cfg.get(debtor, debtor)
     uploader_name = users_cfg.get(uploader, uploader)
     
@@ -525,7 +698,7 @@ def notify_expense_deleted(
     affected_users: List[str]
 ) -> None:
     """Send notification when an expense is deleted."""
-    users_cfg = st.secrets.get("users", {})
+    users_cfg = get_users_config()
     uploader_name = users_cfg.get(uploader, uploader)
     
     affected_names = [users_cfg.get(u, u) for u in affected_users]
@@ -554,6 +727,7 @@ SHARE_TYPE_OPTIONS = {
     "Relative to income – all users": "relative_all",
     "Relative to income – other users only": "relative_others",
 }
+SHARE_TYPE_LABELS = list(SHARE_TYPE_OPTIONS.keys())
 
 
 # -------------------------------------------------------------------
@@ -561,10 +735,9 @@ SHARE_TYPE_OPTIONS = {
 # -------------------------------------------------------------------
 
 @st.cache_resource(show_spinner=False)
-def get_clients():
+def get_credentials() -> Credentials:
     """
-    Returns (gspread_client, drive_service, spreadsheet) using
-    service-account credentials from st.secrets["gcp_service_account"].
+    Returns service-account credentials from st.secrets["gcp_service_account"].
 
     st.secrets expected structure:
 
@@ -586,23 +759,94 @@ def get_clients():
     alice = "Alice Example"
     ...
     """
-    credentials = Credentials.from_service_account_info(
+    return Credentials.from_service_account_info(
         st.secrets["gcp_service_account"],
         scopes=SCOPES,
     )
-    gc = gspread.authorize(credentials)
-    drive = build("drive", "v3", credentials=credentials)
-    spreadsheet = gc.open_by_key(st.secrets["app"]["spreadsheet_id"])
-    return gc, drive, spreadsheet
 
 
-def get_or_create_worksheet(spreadsheet, title: str, headers: List[str]):
-    """Get a worksheet by name or create it with the given header row."""
+@st.cache_resource(show_spinner=False)
+def get_gspread() -> gspread.Client:
+    """Returns the authorized gspread client."""
+    return gspread.authorize(get_credentials())
+
+
+@st.cache_resource(show_spinner=False)
+def get_drive():
+    """Returns the Drive v3 service."""
+    return build("drive", "v3", credentials=get_credentials())
+
+
+@st.cache_resource(show_spinner=False)
+def get_spreadsheet() -> gspread.Spreadsheet:
+    """Returns the app's spreadsheet (st.secrets["app"]["spreadsheet_id"])."""
+    return get_gspread().open_by_key(st.secrets["app"]["spreadsheet_id"])
+
+
+# Sheets/Drive responses worth retrying: rate limited or briefly unavailable.
+# Plain 500s are not retried since a failed append may still have landed.
+RETRYABLE_STATUSES = (429, 503)
+# For appends and positional deletes: a 503 may arrive after the write has
+# landed, and replaying it would duplicate rows or delete the wrong ones.
+# A 429 is rejected before anything is applied, so it is always safe.
+NON_IDEMPOTENT_RETRY_STATUSES = (429,)
+
+
+def with_retries(
+    fn,
+    *args,
+    max_tries: int = 5,
+    retry_statuses: Tuple[int, ...] = RETRYABLE_STATUSES,
+    **kwargs,
+):
+    """
+    Call fn(*args, **kwargs), retrying API errors whose status is in
+    retry_statuses with exponential backoff plus jitter. Other errors
+    propagate at once. Writes that are unsafe to repeat must pass
+    retry_statuses=NON_IDEMPOTENT_RETRY_STATUSES.
+    """
+    for attempt in range(max_tries):
+        try:
+            return fn(*args, **kwargs)
+        except (gspread.exceptions.APIError, HttpError) as e:
+            if isinstance(e, HttpError):
+                status = e.resp.status
+            else:
+                status = getattr(e.response, "status_code", None)
+            if status not in retry_statuses or attempt == max_tries - 1:
+                raise
+            time.sleep(2 ** attempt + random.random())
+
+
+def to_cell_data(value) -> Dict:
+    """
+    Wrap a Python value as Sheets API CellData for updateCells/appendCells
+    requests. Missing numbers (None/NaN) become empty strings.
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return {"userEnteredValue": {"boolValue": bool(value)}}
+    if isinstance(value, (int, float, np.number)):
+        if pd.isna(value):
+            return {"userEnteredValue": {"stringValue": ""}}
+        return {"userEnteredValue": {"numberValue": float(value)}}
+    if value is None:
+        return {"userEnteredValue": {"stringValue": ""}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
+
+
+@st.cache_resource(show_spinner=False)
+def get_or_create_worksheet(_spreadsheet, title: str, headers: Tuple[str, ...]):
+    """
+    Get a worksheet by name or create it with the given header row.
+
+    The handle is cached per (title, headers) for the life of the process,
+    so the worksheet metadata lookup only happens once.
+    """
     try:
-        ws = spreadsheet.worksheet(title)
+        ws = with_retries(_spreadsheet.worksheet, title)
     except gspread.WorksheetNotFound:
-        ws = spreadsheet.add_worksheet(title=title, rows=1000, cols=len(headers))
-        ws.append_row(headers)
+        ws = _spreadsheet.add_worksheet(title=title, rows=1000, cols=len(headers))
+        ws.append_row(list(headers))
         return ws
 
     # Skip the header check - assume headers exist if worksheet exists
@@ -610,129 +854,288 @@ def get_or_create_worksheet(spreadsheet, title: str, headers: List[str]):
     return ws
 
 
+def get_worksheet(title: str) -> gspread.Worksheet:
+    """Cached handle for one of the app's sheets (see SHEET_HEADERS)."""
+    return get_or_create_worksheet(get_spreadsheet(), title, SHEET_HEADERS[title])
+
+
 # -------------------------------------------------------------------
 # DATA ACCESS HELPERS WITH CACHING
 # -------------------------------------------------------------------
 
-def invalidate_data_cache():
-    """Call this after any data modification to clear cached data."""
-    st.cache_data.clear()
+# All three sheets are fetched together in one batchGet, so invalidating any
+# one of them refetches the lot - still a single request on the next read.
+# Derived caches are keyed on sheets_generation(), so starting a new
+# generation invalidates them too.
+
+def invalidate_paychecks_cache():
+    """Clear cached paycheck data (and the income means derived from it)."""
+    sheets_generation.clear()
+
+
+def invalidate_items_cache():
+    """Clear cached items sheet data (and the expense groups derived from it)."""
+    sheets_generation.clear()
+
+
+def invalidate_archive_cache():
+    """Clear cached archive sheet data (and the pending approvals derived from it)."""
+    sheets_generation.clear()
+
+
+# Sheet cell values that count as True for boolean columns; anything else
+# (including "FALSE" and blanks) is False.
+TRUTHY_VALUES = ["TRUE", "True", "true", "1", "yes", "Yes", "YES", True, 1]
+
+
+def to_bool_column(values: pd.Series) -> pd.Series:
+    """Parse a boolean-ish sheet column into a real bool Series."""
+    return values.isin(TRUTHY_VALUES)
+
+
+def values_to_df(values: List[List[str]], headers: Tuple[str, ...]) -> pd.DataFrame:
+    """
+    Build a DataFrame from raw sheet values (header row first),
+    guaranteeing exactly the given columns in the given order.
+    """
+    if len(values) <= 1:
+        return pd.DataFrame(columns=headers)
+
+    if values[0] == list(headers):
+        # Sheet layout matches exactly - no column realignment needed
+        return pd.DataFrame(values[1:], columns=headers)
+    return pd.DataFrame(values[1:], columns=values[0]).reindex(columns=headers)
+
+
+# Columns coerced to floats on load
+AMOUNT_COLUMNS = ["amount_total", "amount_owed"]
+
+# Shared read-only placeholder for views over an empty items sheet
+_EMPTY_ITEMS_DF = pd.DataFrame(columns=ITEMS_HEADERS)
+
+SHEET_HEADERS = {
+    PAYCHECKS_SHEET: PAYCHECKS_HEADERS,
+    ITEMS_SHEET: ITEMS_HEADERS,
+    ARCHIVE_SHEET: ARCHIVE_HEADERS,
+}
 
 
 @st.cache_data(ttl=120, show_spinner=False)
-def _cached_load_paychecks() -> List[Dict]:
-    """Cached version of paychecks loading - returns raw records."""
-    _, _, spreadsheet = get_clients()
-    ws = get_or_create_worksheet(spreadsheet, PAYCHECKS_SHEET, PAYCHECKS_HEADERS)
-    return ws.get_all_records()
+def sheets_generation() -> int:
+    """
+    Token identifying the current sheet fetch. It changes when the 120s TTL
+    expires or an invalidate_*_cache helper runs, and it is cheap to hash, so
+    derived caches key on it instead of on the sheet values themselves.
+    """
+    return time.time_ns()
+
+
+def _cached_load_all_sheets() -> Dict[str, List[List[str]]]:
+    """Raw values of every app sheet for the current generation."""
+    return _cached_fetch_all_sheets(sheets_generation())
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def _cached_fetch_all_sheets(generation: int) -> Dict[str, List[List[str]]]:
+    """
+    Fetch the raw values of every app sheet in a single values.batchGet
+    request. Returns {sheet title: rows}, header row first.
+    """
+    spreadsheet = get_spreadsheet()
+    # Make sure every sheet exists before asking for its range
+    for title in SHEET_HEADERS:
+        get_worksheet(title)
+
+    titles = list(SHEET_HEADERS)
+    response = with_retries(
+        spreadsheet.values_batch_get,
+        [gspread.utils.absolute_range_name(title, "A:Z") for title in titles],
+    )
+
+    sheets = {}
+    for title, value_range in zip(titles, response.get("valueRanges", [])):
+        values = value_range.get("values", [])
+        # The API trims trailing blank cells; pad like get_all_values() does
+        sheets[title] = gspread.utils.fill_gaps(values) if values else []
+    return sheets
+
+
+def _cached_load_paychecks() -> List[List[str]]:
+    """Raw paychecks sheet values from the shared cached fetch."""
+    return _cached_load_all_sheets()[PAYCHECKS_SHEET]
 
 
 def load_paychecks_df() -> pd.DataFrame:
-    records = _cached_load_paychecks()
-    if not records:
-        return pd.DataFrame(columns=PAYCHECKS_HEADERS)
+    return values_to_df(_cached_load_paychecks(), PAYCHECKS_HEADERS)
 
-    df = pd.DataFrame(records)
-    for col in PAYCHECKS_HEADERS:
-        if col not in df.columns:
-            df[col] = None
-    return df[PAYCHECKS_HEADERS]
+
+def paycheck_row_numbers() -> Dict[str, int]:
+    """
+    Map each username to its sheet row number in the paychecks sheet,
+    built from the cached sheet values. Rows are only ever appended or
+    updated in place, so the numbers stay valid across cache refreshes.
+    """
+    row_numbers = {}
+    # +1 for 0-based index, +1 for header row; first occurrence wins
+    for i, values in enumerate(_cached_load_paychecks()[1:]):
+        if values:
+            row_numbers.setdefault(values[0], i + 2)
+    return row_numbers
 
 
 def upsert_paychecks(username: str, p1: float, p2: float, p3: float) -> None:
-    _, _, spreadsheet = get_clients()
-    ws = get_or_create_worksheet(spreadsheet, PAYCHECKS_SHEET, PAYCHECKS_HEADERS)
+    ws = get_worksheet(PAYCHECKS_SHEET)
 
-    df = load_paychecks_df()
-    avg_val = float(pd.Series([p1, p2, p3]).mean())
+    avg_val = (p1 + p2 + p3) / 3
 
-    if not df.empty and username in df["username"].values:
-        idx = df.index[df["username"] == username][0]
-        row_number = idx + 2  # +1 for 0-based index, +1 for header row
-        ws.update(f"A{row_number}:E{row_number}", [[username, p1, p2, p3, avg_val]])
+    row = [username, p1, p2, p3, avg_val]
+    row_number = paycheck_row_numbers().get(username)
+    if row_number is not None:
+        with_retries(ws.batch_update, [{"range": f"A{row_number}:{PAYCHECKS_LAST_COL_LETTER}{row_number}", "values": [row]}])
     else:
-        ws.append_row([username, p1, p2, p3, avg_val])
+        with_retries(ws.append_rows, [row], retry_statuses=NON_IDEMPOTENT_RETRY_STATUSES)
     
     # Invalidate cache after modification
-    invalidate_data_cache()
+    invalidate_paychecks_cache()
 
 
-@st.cache_data(ttl=120, show_spinner=False)
-def _cached_compute_income_means() -> Dict[str, float]:
-    """Cached computation of income means."""
-    records = _cached_load_paychecks()
-    if not records:
-        return {}
+def _parse_float(val) -> Optional[float]:
+    """Parse a sheet cell as a float; blanks and non-numbers give None."""
+    try:
+        num = float(val)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(num) else num
 
-    df = pd.DataFrame(records)
-    for col in PAYCHECKS_HEADERS:
-        if col not in df.columns:
-            df[col] = None
-    df = df[PAYCHECKS_HEADERS]
 
-    for col in ["pay1", "pay2", "pay3"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    df["average"] = df[["pay1", "pay2", "pay3"]].mean(axis=1)
+@st.cache_data(max_entries=2, show_spinner=False)
+def _cached_compute_income_means(generation: int) -> Dict[str, float]:
+    """
+    Cached computation of income means, keyed on the sheet fetch generation.
 
-    df = df.dropna(subset=["username", "average"])
-    return dict(zip(df["username"], df["average"]))
+    Works on the raw paychecks rows - a handful of users doesn't justify
+    building a DataFrame.
+    """
+    values = _cached_fetch_all_sheets(generation)[PAYCHECKS_SHEET]
+    if len(values) <= 1:
+        return {}
+
+    header = values[0]
+    if "username" not in header:
+        return {}
+    user_col = header.index("username")
+    pay_cols = [header.index(col) for col in ("pay1", "pay2", "pay3") if col in header]
+
+    means = {}
+    for row in values[1:]:
+        username = row[user_col]
+        pays = [p for p in (_parse_float(row[c]) for c in pay_cols) if p is not None]
+        if username and pays:
+            means[username] = sum(pays) / len(pays)
+    return means
 
 
 def compute_income_means() -> Dict[str, float]:
     """Return {username: mean_of_last_3_paychecks}."""
-    return _cached_compute_income_means()
+    return _cached_compute_income_means(sheets_generation())
 
 
-@st.cache_data(ttl=120, show_spinner=False)
-def _cached_load_items() -> List[Dict]:
-    """Cached version of items loading - returns raw records."""
-    _, _, spreadsheet = get_clients()
-    ws = get_or_create_worksheet(spreadsheet, ITEMS_SHEET, ITEMS_HEADERS)
-    return ws.get_all_records()
+def _cached_load_items() -> List[List[str]]:
+    """Raw items sheet values from the shared cached fetch."""
+    return _cached_load_all_sheets()[ITEMS_SHEET]
+
+
+def items_values_to_df(values: List[List[str]]) -> pd.DataFrame:
+    df = values_to_df(values, ITEMS_HEADERS)
+
+    if not df.empty:
+        df[AMOUNT_COLUMNS] = df[AMOUNT_COLUMNS].apply(pd.to_numeric, errors="coerce")
+    df["paid"] = to_bool_column(df["paid"])
+
+    return df
 
 
 def load_items_df() -> pd.DataFrame:
-    records = _cached_load_items()
-    if not records:
-        return pd.DataFrame(columns=ITEMS_HEADERS)
+    return items_values_to_df(_cached_load_items())
 
-    df = pd.DataFrame(records)
-    for col in ITEMS_HEADERS:
-        if col not in df.columns:
-            df[col] = None
 
-    if not df.empty:
-        for col in ["amount_total", "amount_owed"]:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-        # Don't convert paid to bool here - let the UI handle it properly
+# Derived caches below are keyed on sheets_generation() as well as the
+# username, so they refresh whenever the shared fetch does (writes from
+# other processes or direct sheet edits included) - no TTL of their own.
 
-    return df[ITEMS_HEADERS]
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_expense_groups(username: str, generation: int) -> pd.DataFrame:
+    items_df = items_values_to_df(_cached_fetch_all_sheets(generation)[ITEMS_SHEET])
+    if items_df.empty:
+        return pd.DataFrame()
 
+    my_expenses = items_df[items_df["uploader"].to_numpy() == username]
+    if my_expenses.empty:
+        return pd.DataFrame()
 
-@st.cache_data(ttl=120, show_spinner=False)
-def _cached_load_archive() -> List[Dict]:
-    """Cached version of archive loading - returns raw records."""
-    _, _, spreadsheet = get_clients()
-    ws = get_or_create_worksheet(spreadsheet, ARCHIVE_SHEET, ARCHIVE_HEADERS)
-    return ws.get_all_records()
+    return my_expenses.groupby("purchase_id").agg(
+        description=("description", "first"),
+        amount_total=("amount_total", "first"),
+        purchase_date=("purchase_date", "first"),
+        timestamp=("timestamp", "first"),
+        # Joined once here rather than in both dashboard render loops
+        debtors=("debtor", ", ".join),
+    ).reset_index()
 
 
-def load_archive_df() -> pd.DataFrame:
-    records = _cached_load_archive()
-    if not records:
-        return pd.DataFrame(columns=ARCHIVE_HEADERS)
+def load_expense_groups(username: str) -> pd.DataFrame:
+    """
+    One row per purchase uploaded by username: description, amount_total,
+    purchase_date, timestamp and the comma-joined debtors.
+    """
+    return _cached_expense_groups(username, sheets_generation())
+
+
+def _cached_load_archive() -> List[List[str]]:
+    """Raw archive sheet values from the shared cached fetch."""
+    return _cached_load_all_sheets()[ARCHIVE_SHEET]
 
-    df = pd.DataFrame(records)
-    for col in ARCHIVE_HEADERS:
-        if col not in df.columns:
-            df[col] = None
+
+def archive_values_to_df(values: List[List[str]]) -> pd.DataFrame:
+    df = values_to_df(values, ARCHIVE_HEADERS)
 
     if not df.empty:
-        # Don't convert paid/approved to bool here - let the UI handle it properly
-        for col in ["amount_total", "amount_owed"]:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
+        df[AMOUNT_COLUMNS] = df[AMOUNT_COLUMNS].apply(pd.to_numeric, errors="coerce")
+    for col in ["paid", "approved"]:
+        df[col] = to_bool_column(df[col])
+
+    return df
+
+
+def load_archive_df() -> pd.DataFrame:
+    return archive_values_to_df(_cached_load_archive())
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_pending_approvals(username: str, generation: int) -> pd.DataFrame:
+    """Keyed on the sheet fetch generation; see _cached_expense_groups."""
+    archive_df = archive_values_to_df(_cached_fetch_all_sheets(generation)[ARCHIVE_SHEET])
+    if archive_df.empty:
+        return archive_df
 
-    return df[ARCHIVE_HEADERS]
+    # Narrow to the user's uploads first; most users own a small slice
+    mine = archive_df["uploader"].to_numpy() == username
+    if not mine.any():
+        return archive_df.iloc[:0]
+    mine_df = archive_df[mine]
+
+    return mine_df[
+        ~mine_df["approved"].to_numpy(dtype=bool)
+        & mine_df["paid"].to_numpy(dtype=bool)
+    ]
+
+
+def load_pending_approvals(username: str) -> pd.DataFrame:
+    """
+    Archive rows uploaded by username that were paid but not yet approved.
+    Keeps the archive index, so rows can be passed to approve_payments.
+    """
+    return _cached_pending_approvals(username, sheets_generation())
 
 
 # -------------------------------------------------------------------
@@ -755,17 +1158,19 @@ def upload_receipt_file(uploaded_file, purchase_id: str) -> Optional[str]:
         # Attachments disabled – just skip silently
         return None
 
-    _, drive_service, _ = get_clients()
+    drive_service = get_drive()
 
-    # Read file into memory
-    file_bytes = uploaded_file.read()
-    if not file_bytes:
+    if not uploaded_file.size:
         return None
 
+    # Stream straight from the uploaded file's buffer instead of copying it
+    uploaded_file.seek(0)
     media = MediaIoBaseUpload(
-        io.BytesIO(file_bytes),
+        uploaded_file,
         mimetype=uploaded_file.type or "application/octet-stream",
-        resumable=False,
+        # Most receipts fit in one chunk; larger ones need few round trips
+        chunksize=8 * 1024 * 1024,
+        resumable=True,
     )
     metadata = {
         "name": f"{purchase_id}_{uploaded_file.name}",
@@ -780,7 +1185,8 @@ def upload_receipt_file(uploaded_file, purchase_id: str) -> Optional[str]:
                 media_body=media,
                 fields="id,webViewLink,webContentLink",
             )
-            .execute()
+            # The client's own backoff also resumes interrupted chunks
+            .execute(num_retries=4)
         )
     except HttpError as e:
         # 403 with 'Service Accounts do not have storage quota' is common here
@@ -797,6 +1203,45 @@ def upload_receipt_file(uploaded_file, purchase_id: str) -> Optional[str]:
 # BUSINESS LOGIC
 # -------------------------------------------------------------------
 
+def compute_share_ratios(share_type: str, uploader: str) -> Tuple[List[str], List[float]]:
+    """
+    Return (debtors, ratios) for an expense uploaded by `uploader`: the users
+    who owe a share and the fraction of the total each one owes.
+    """
+    return _cached_share_ratios(share_type, uploader, sheets_generation())
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_share_ratios(
+    share_type: str, uploader: str, generation: int
+) -> Tuple[List[str], List[float]]:
+    """Cached per (share_type, uploader) and sheet fetch generation."""
+    income_means = _cached_compute_income_means(generation)
+    if not income_means:
+        raise ValueError("No paycheck data found. Ask all users to update their paychecks first.")
+
+    # Everyone with income except the uploader - never create a row where
+    # someone "owes themselves"
+    debtors = [u for u in get_users_config() if u != uploader and u in income_means]
+
+    if share_type == "relative_all":
+        # The uploader's own share is implicit but still counts in the split
+        participants = debtors + [uploader] if uploader in income_means else debtors
+    elif share_type == "relative_others":
+        participants = debtors
+    else:
+        raise ValueError(f"Unknown share_type: {share_type}")
+
+    if not participants:
+        raise ValueError("No participants found for this share type (check paychecks).")
+
+    denom = sum(income_means[u] for u in participants)
+    if denom <= 0:
+        raise ValueError("Participants must have positive average paychecks.")
+
+    return debtors, [float(income_means[u]) / float(denom) for u in debtors]
+
+
 def add_expense_and_create_debts(
     uploader: str,
     description: str,
@@ -861,94 +1306,72 @@ def batch_add_expenses_and_create_debts(
     if not valid_expenses:
         raise ValueError("No valid expenses to create.")
 
-    _, _, spreadsheet = get_clients()
-    items_ws = get_or_create_worksheet(spreadsheet, ITEMS_SHEET, ITEMS_HEADERS)
+    purchase_ids = [str(uuid.uuid4()) for _ in valid_expenses]
 
-    income_means = compute_income_means()
-    if not income_means:
-        raise ValueError("No paycheck data found. Ask all users to update their paychecks first.")
-
-    all_usernames = list(st.secrets["users"].keys())
-    participants = [u for u in all_usernames if u in income_means]
+    # Validate the split first (cached, cheap) so a ValueError never leaves
+    # an orphaned receipt behind in Drive
+    debtors, ratios = compute_share_ratios(share_type, uploader)
+    income_ratios = np.array(ratios, dtype=float)
 
-    if share_type == "relative_all":
-        # participants already = everyone with income
-        pass
-    elif share_type == "relative_others":
-        participants = [u for u in participants if u != uploader]
-    else:
-        raise ValueError(f"Unknown share_type: {share_type}")
+    if not debtors:
+        raise ValueError(
+            "No debt rows were created. This happens when there are no other users "
+            "with paycheck data to share the expense with. Add more users' paychecks "
+            "or use 'Only me (no sharing)' option."
+        )
 
-    if not participants:
-        raise ValueError("No participants found for this share type (check paychecks).")
+    items_ws = get_worksheet(ITEMS_SHEET)
 
-    denom = sum(income_means[u] for u in participants)
-    if denom <= 0:
-        raise ValueError("Participants must have positive average paychecks.")
+    # Only the first expense gets the receipt. Start the Drive upload now so
+    # it overlaps with building the rows below.
+    receipt_file = valid_expenses[0].get("file")
+    receipt_future = (
+        run_in_background(upload_receipt_file, receipt_file, purchase_ids[0])
+        if receipt_file else None
+    )
 
-    # Build all rows for batch append
-    all_rows = []
     now_iso = datetime.now(timezone.utc).isoformat()
+    today = date.today()
 
+    # Per-expense row segments, computed once per expense rather than per
+    # debt row: (prefix, suffix, tail) around the per-debtor columns
+    expense_fields = []
     for idx, exp in enumerate(valid_expenses):
-        total_amount = exp["amount"]
-        description = exp["description"].strip()
-        purchase_date = exp.get("date") or datetime.now().date()
-        uploaded_file = exp.get("file") if idx == 0 else None  # Only first expense gets receipt
-
-        purchase_id = str(uuid.uuid4())
+        purchase_date = exp.get("date") or today
         purchase_date_str = purchase_date.isoformat() if hasattr(purchase_date, 'isoformat') else str(purchase_date)
-
-        receipt_url = upload_receipt_file(uploaded_file, purchase_id) if uploaded_file else None
-
-        for debtor in participants:
-            # Never create a row where someone "owes themselves"
-            if debtor == uploader:
-                continue
-
-            share = float(total_amount) * float(income_means[debtor]) / float(denom)
-            share = round(share, 2)
-
-            row_id = str(uuid.uuid4())
-            row = [
-                row_id,
-                purchase_id,
-                now_iso,
-                purchase_date_str,
-                uploader,
-                debtor,
-                description,
-                float(total_amount),
-                share,
-                share_type,
-                receipt_url or "",
-                False,  # paid
-                "",     # paid_at
-                "",     # paid_by
-            ]
-            all_rows.append(row)
-
-    if not all_rows:
-        raise ValueError(
-            "No debt rows were created. This happens when there are no other users "
-            "with paycheck data to share the expense with. Add more users' paychecks "
-            "or use 'Only me (no sharing)' option."
-        )
+        receipt_url = receipt_future.result() if idx == 0 and receipt_future else None
+        expense_fields.append((
+            (purchase_ids[idx], now_iso, purchase_date_str, uploader),
+            (exp["description"].strip(), float(exp["amount"])),
+            # share_type, receipt_url, paid, paid_at, paid_by
+            (share_type, receipt_url or "", False, "", ""),
+        ))
+
+    # Every debtor's share of every expense in one broadcast:
+    # rows are expenses, columns are debtors
+    totals = np.array([suffix[1] for _, suffix, _ in expense_fields], dtype=float)
+    share_matrix = np.round(np.outer(totals, income_ratios), 2).tolist()
+
+    # Build all rows for batch append, in ITEMS_HEADERS order
+    all_rows = [
+        (str(uuid.uuid4()), *prefix, debtor, *suffix, share, *tail)
+        for (prefix, suffix, tail), shares in zip(expense_fields, share_matrix)
+        for debtor, share in zip(debtors, shares)
+    ]
 
     # Use batch append - single API call for all rows!
-    items_ws.append_rows(all_rows, value_input_option='USER_ENTERED')
+    with_retries(
+        items_ws.append_rows,
+        all_rows,
+        value_input_option='USER_ENTERED',
+        retry_statuses=NON_IDEMPOTENT_RETRY_STATUSES,
+    )
     
     # Invalidate cache after modification
-    invalidate_data_cache()
+    invalidate_items_cache()
     
     # Return count and affected users (debtors who are not the uploader)
-    affected_users = [p for p in participants if p != uploader]
-    return (len(valid_expenses), affected_users)
-
-
-def delete_expense_debts(current_user: str, purchase_id: str) -> None:
-    """Delete all debt rows associated with a purchase_id (only if current_user is the uploader)."""
-    batch_delete_expense_debts(current_user, [purchase_id])
+    return (len(valid_expenses), debtors)
 
 
 def batch_delete_expense_debts(current_user: str, purchase_ids: List[str]) -> int:
@@ -962,187 +1385,200 @@ def batch_delete_expense_debts(current_user: str, purchase_ids: List[str]) -> in
     if not purchase_ids:
         return 0
         
-    _, _, spreadsheet = get_clients()
-    items_ws = get_or_create_worksheet(spreadsheet, ITEMS_SHEET, ITEMS_HEADERS)
+    spreadsheet = get_spreadsheet()
+    items_ws = get_worksheet(ITEMS_SHEET)
     
     items_df = load_items_df()
     if items_df.empty:
         return 0
     
-    # Get all rows matching any of the purchase_ids
-    matching_rows = items_df[items_df["purchase_id"].isin(purchase_ids)]
+    # Rows of any of the purchase_ids, restricted to current_user's uploads
+    matching_rows = items_df[
+        items_df["purchase_id"].isin(purchase_ids).to_numpy()
+        & (items_df["uploader"].to_numpy() == current_user)
+    ]
     if matching_rows.empty:
         return 0
     
-    # Filter to only rows where current_user is the uploader
-    matching_rows = matching_rows[matching_rows["uploader"] == current_user]
-    if matching_rows.empty:
-        return 0
+    # Collect info for email notifications (one groupby pass over purchase_id)
+    grouped = matching_rows.groupby("purchase_id", sort=False).agg(
+        description=("description", "first"),
+        total_amount=("amount_total", "first"),
+        affected_users=("debtor", "unique"),
+    )
+    notifications_data = [
+        {
+            "description": str(group.description),
+            "total_amount": float(group.total_amount),
+            "affected_users": list(group.affected_users),
+        }
+        for group in grouped.itertuples(index=False)
+    ]
     
-    # Collect info for email notifications (group by purchase_id)
-    deleted_purchases = set()
-    notifications_data = []
-    for pid in matching_rows["purchase_id"].unique():
-        pid_rows = matching_rows[matching_rows["purchase_id"] == pid]
-        notifications_data.append({
-            "description": str(pid_rows.iloc[0]["description"]),
-            "total_amount": float(pid_rows.iloc[0]["amount_total"]),
-            "affected_users": list(pid_rows["debtor"].unique())
-        })
-        deleted_purchases.add(pid)
-    
-    # Get all sheet row numbers (sorted in reverse to maintain indices when deleting)
-    rows_to_delete = sorted([idx + 2 for idx in matching_rows.index], reverse=True)
-    
-    if rows_to_delete:
-        # Use batch delete request via Sheets API for maximum efficiency
-        # Group consecutive rows for batch deletion
-        delete_requests = []
-        i = 0
-        while i < len(rows_to_delete):
-            start_row = rows_to_delete[i]
-            end_row = start_row
-            
-            # Find consecutive rows (remember we're going in reverse, so consecutive means -1)
-            while i + 1 < len(rows_to_delete) and rows_to_delete[i + 1] == rows_to_delete[i] - 1:
-                i += 1
-                end_row = rows_to_delete[i]
-            
-            # end_row is the smaller number (earlier row), start_row is larger (later row)
-            # Sheets API deleteDimension uses 0-indexed, exclusive end
-            delete_requests.append({
-                'deleteDimension': {
-                    'range': {
-                        'sheetId': items_ws.id,
-                        'dimension': 'ROWS',
-                        'startIndex': end_row - 1,  # Convert to 0-indexed
-                        'endIndex': start_row  # Exclusive, so this is correct
-                    }
+    # Sheet row numbers (+1 for 0-based index, +1 for header row), split into
+    # runs of consecutive rows so each run is a single deleteDimension
+    sheet_rows = np.sort(matching_rows.index.to_numpy()) + 2
+    runs = np.split(sheet_rows, np.flatnonzero(np.diff(sheet_rows) != 1) + 1)
+
+    # Delete bottom-up so earlier deletions don't shift the later ranges.
+    # Sheets API deleteDimension uses 0-indexed, exclusive end.
+    delete_requests = [
+        {
+            'deleteDimension': {
+                'range': {
+                    'sheetId': items_ws.id,
+                    'dimension': 'ROWS',
+                    'startIndex': int(run[0]) - 1,
+                    'endIndex': int(run[-1]),
                 }
-            })
-            i += 1
-        
-        # Execute all deletes in a single batch request
-        if delete_requests:
-            spreadsheet.batch_update({'requests': delete_requests})
+            }
+        }
+        for run in reversed(runs)
+    ]
+
+    # Execute all deletes in a single batch request
+    with_retries(
+        spreadsheet.batch_update,
+        {'requests': delete_requests},
+        retry_statuses=NON_IDEMPOTENT_RETRY_STATUSES,
+    )
     
     # Invalidate cache after modification
-    invalidate_data_cache()
+    invalidate_items_cache()
     
     # Send email notifications
     for notif in notifications_data:
         if notif["affected_users"]:
             notify_expense_deleted(current_user, notif["description"], notif["total_amount"], notif["affected_users"])
     
-    return len(deleted_purchases)
-
-def mark_debts_as_paid(current_user: str, debt_ids: List[str]) -> None:
-    if not debt_ids:
-        return
+    return len(grouped)
 
-    _, _, spreadsheet = get_clients()
-    items_ws = get_or_create_worksheet(spreadsheet, ITEMS_SHEET, ITEMS_HEADERS)
-    archive_ws = get_or_create_worksheet(spreadsheet, ARCHIVE_SHEET, ARCHIVE_HEADERS)
+def mark_debts_as_paid(current_user: str, debt_rows: pd.DataFrame) -> None:
+    """
+    Mark the given items rows as paid and copy them to the archive.
 
-    items_df = load_items_df()
-    if items_df.empty:
+    debt_rows must be a slice of load_items_df() that keeps the original
+    index, which is used to address the sheet rows without reloading.
+    """
+    if debt_rows.empty:
         return
 
-    now_iso = datetime.now(timezone.utc).isoformat()
-
-    # Collect all updates for batch processing
-    items_batch_updates = []
-    archive_rows = []
-    notifications = []  # Store notification data for later
+    spreadsheet = get_spreadsheet()
+    items_ws = get_worksheet(ITEMS_SHEET)
+    archive_ws = get_worksheet(ARCHIVE_SHEET)
 
-    for debt_id in debt_ids:
-        if debt_id not in items_df["id"].values:
-            continue
-
-        row_idx_df = items_df.index[items_df["id"] == debt_id][0]
-        # Only the debtor can mark their own debts as paid
-        debtor_username = str(items_df.loc[row_idx_df, "debtor"])
-        if debtor_username != current_user:
-            continue
-
-        sheet_row = row_idx_df + 2  # + header row
+    now_iso = datetime.now(timezone.utc).isoformat()
 
-        # Collect updates for batch operation
-        items_batch_updates.append({
-            'range': f'{gspread.utils.rowcol_to_a1(sheet_row, ITEMS_COL_INDEX["paid"])}',
-            'values': [[True]]
-        })
-        items_batch_updates.append({
-            'range': f'{gspread.utils.rowcol_to_a1(sheet_row, ITEMS_COL_INDEX["paid_at"])}',
-            'values': [[now_iso]]
-        })
-        items_batch_updates.append({
-            'range': f'{gspread.utils.rowcol_to_a1(sheet_row, ITEMS_COL_INDEX["paid_by"])}',
-            'values': [[current_user]]
-        })
+    # Only the debtor can mark their own debts as paid
+    mine = debt_rows[debt_rows["debtor"].astype(str).to_numpy() == current_user]
+
+    # Items updates and archive appends all go into one spreadsheet batchUpdate
+    paid_col = ITEMS_COL_INDEX["paid"] - 1  # 0-based grid column
+    paid_cells = [to_cell_data(v) for v in (True, now_iso, current_user)]
+    requests = [
+        {
+            # paid, paid_at, paid_by are adjacent columns - write them as one range
+            'updateCells': {
+                'range': {
+                    'sheetId': items_ws.id,
+                    'startRowIndex': int(row_idx_df) + 1,  # 0-based grid row, + header row
+                    'endRowIndex': int(row_idx_df) + 2,
+                    'startColumnIndex': paid_col,
+                    'endColumnIndex': paid_col + 3,
+                },
+                'rows': [{'values': paid_cells}],
+                'fields': 'userEnteredValue',
+            }
+        }
+        for row_idx_df in mine.index
+    ]
 
-        # Prepare archive row
-        row_dict = items_df.loc[row_idx_df].to_dict()
-        row_dict["paid"] = True
-        row_dict["paid_at"] = now_iso
-        row_dict["paid_by"] = current_user
-        row_dict["approved"] = False
-        row_dict["approved_at"] = ""
-        row_dict["approved_by"] = ""
-
-        archive_row = [row_dict.get(col, "") for col in ARCHIVE_HEADERS]
-        archive_rows.append(archive_row)
-        
-        # Store notification data
-        notifications.append({
-            "uploader": str(items_df.loc[row_idx_df, "uploader"]),
-            "description": str(items_df.loc[row_idx_df, "description"]),
-            "amount": float(items_df.loc[row_idx_df, "amount_owed"])
+    if not mine.empty:
+        # Archive copies: the same rows with the paid/approval columns set,
+        # laid out in archive column order in one go
+        archive_rows = (
+            mine.assign(
+                paid=True,
+                paid_at=now_iso,
+                paid_by=current_user,
+                approved=False,
+                approved_at="",
+                approved_by="",
+            )
+            .reindex(columns=ARCHIVE_HEADERS, fill_value="")
+            .to_numpy(dtype=object)
+            .tolist()
+        )
+        requests.append({
+            'appendCells': {
+                'sheetId': archive_ws.id,
+                'rows': [
+                    {'values': [to_cell_data(v) for v in archive_row]}
+                    for archive_row in archive_rows
+                ],
+                'fields': 'userEnteredValue',
+            }
         })
 
-    # Execute batch update for items sheet (single API call)
-    if items_batch_updates:
-        items_ws.batch_update(items_batch_updates, value_input_option='USER_ENTERED')
+    # Store notification data
+    notifications = [
+        {"uploader": str(uploader), "description": str(description), "amount": float(amount)}
+        for uploader, description, amount in zip(
+            mine["uploader"], mine["description"], mine["amount_owed"]
+        )
+    ]
 
-    # Execute batch append for archive sheet (single API call)
-    if archive_rows:
-        archive_ws.append_rows(archive_rows, value_input_option='USER_ENTERED')
+    # Items updates + archive append in a single API call
+    if requests:
+        # Includes an appendCells, so not safe to replay on 503
+        with_retries(
+            spreadsheet.batch_update,
+            {'requests': requests},
+            retry_statuses=NON_IDEMPOTENT_RETRY_STATUSES,
+        )
 
     # Invalidate cache after modification
-    invalidate_data_cache()
+    invalidate_items_cache()
+    invalidate_archive_cache()
 
-    # Send email notifications after successful updates
+    # Send email notifications after successful updates: one email per
+    # uploader, listing every payment they need to approve
+    by_uploader: Dict[str, List[Dict]] = {}
     for notif in notifications:
-        notify_payment_marked(
-            debtor=current_user,
-            uploader=notif["uploader"],
-            description=notif["description"],
-            amount=notif["amount"]
-        )
+        by_uploader.setdefault(notif["uploader"], []).append(notif)
 
+    for uploader, payments in by_uploader.items():
+        if len(payments) > 1:
+            notify_multiple_payments_marked(current_user, uploader, payments)
+        else:
+            notify_payment_marked(
+                debtor=current_user,
+                uploader=uploader,
+                description=payments[0]["description"],
+                amount=payments[0]["amount"]
+            )
 
-def approve_payments(current_user: str, archive_ids: List[str]) -> None:
-    if not archive_ids:
-        return
 
-    _, _, spreadsheet = get_clients()
-    archive_ws = get_or_create_worksheet(spreadsheet, ARCHIVE_SHEET, ARCHIVE_HEADERS)
-    archive_df = load_archive_df()
-    if archive_df.empty:
+def approve_payments(current_user: str, pending_rows: pd.DataFrame) -> None:
+    """
+    Approve the given archive rows.
+
+    pending_rows must be a slice of load_archive_df() that keeps the
+    original index, which is used to address the sheet rows.
+    """
+    if pending_rows.empty:
         return
 
+    archive_ws = get_worksheet(ARCHIVE_SHEET)
+
     now_iso = datetime.now(timezone.utc).isoformat()
 
     # Collect all updates for batch processing
     batch_updates = []
     notifications = []
 
-    for arc_id in archive_ids:
-        if arc_id not in archive_df["id"].values:
-            continue
-
-        row_idx_df = archive_df.index[archive_df["id"] == arc_id][0]
-        uploader = str(archive_df.loc[row_idx_df, "uploader"])
+    for row_idx_df, row in zip(pending_rows.index, pending_rows.to_dict("records")):
+        uploader = str(row["uploader"])
 
         # Only the uploader (who originally paid for the item) can approve
         if uploader != current_user:
@@ -1150,33 +1586,28 @@ def approve_payments(current_user: str, archive_ids: List[str]) -> None:
 
         sheet_row = row_idx_df + 2
         
-        # Collect updates for batch operation
-        batch_updates.append({
-            'range': f'{gspread.utils.rowcol_to_a1(sheet_row, ARCHIVE_COL_INDEX["approved"])}',
-            'values': [[True]]
-        })
+        # approved, approved_at, approved_by are adjacent columns - write them as one range
         batch_updates.append({
-            'range': f'{gspread.utils.rowcol_to_a1(sheet_row, ARCHIVE_COL_INDEX["approved_at"])}',
-            'values': [[now_iso]]
-        })
-        batch_updates.append({
-            'range': f'{gspread.utils.rowcol_to_a1(sheet_row, ARCHIVE_COL_INDEX["approved_by"])}',
-            'values': [[current_user]]
+            'range': (
+                f'{ARCHIVE_COL_LETTERS["approved"]}{sheet_row}:'
+                f'{ARCHIVE_COL_LETTERS["approved_by"]}{sheet_row}'
+            ),
+            'values': [[True, now_iso, current_user]]
         })
         
         # Store notification data
         notifications.append({
-            "debtor": str(archive_df.loc[row_idx_df, "debtor"]),
-            "description": str(archive_df.loc[row_idx_df, "description"]),
-            "amount": float(archive_df.loc[row_idx_df, "amount_owed"])
+            "debtor": str(row["debtor"]),
+            "description": str(row["description"]),
+            "amount": float(row["amount_owed"])
         })
 
     # Execute batch update (single API call for all updates)
     if batch_updates:
-        archive_ws.batch_update(batch_updates, value_input_option='USER_ENTERED')
+        with_retries(archive_ws.batch_update, batch_updates, value_input_option='USER_ENTERED')
 
     # Invalidate cache after modification
-    invalidate_data_cache()
+    invalidate_archive_cache()
 
     # Send email notifications after successful updates
     for notif in notifications:
@@ -1192,6 +1623,12 @@ def approve_payments(current_user: str, archive_ids: List[str]) -> None:
 # AUTH & USER RESOLUTION
 # -------------------------------------------------------------------
 
+@st.cache_resource(show_spinner=False)
+def get_users_config() -> Dict[str, str]:
+    """Return the {username: display name} mapping from st.secrets["users"]."""
+    return dict(st.secrets.get("users", {}))
+
+
 def require_login() -> str:
     """Ensure user is logged in and allowed. Returns username (email prefix)."""
     if not getattr(st.user, "is_logged_in", False):
@@ -1207,7 +1644,7 @@ def require_login() -> str:
         st.stop()
 
     username = email.split("@")[0].lower()
-    users_cfg = st.secrets.get("users", {})
+    users_cfg = get_users_config()
 
     if username not in users_cfg:
         st.error(
@@ -1220,8 +1657,10 @@ def require_login() -> str:
 
     display_name = users_cfg[username]
     
-    # Show personalized greeting in sidebar
-    greeting = get_random_greeting(display_name)
+    # Show personalized greeting in sidebar (picked once per session)
+    if "greeting" not in st.session_state:
+        st.session_state.greeting = get_random_greeting(display_name)
+    greeting = st.session_state.greeting
     st.sidebar.markdown(f"### {greeting}")
     st.sidebar.markdown(f"**{display_name}**  \n`{email}`")
     st.sidebar.markdown("---")
@@ -1237,6 +1676,7 @@ def require_login() -> str:
 # UI PAGES
 # -------------------------------------------------------------------
 
+@st.fragment
 def page_dashboard(username: str):
     emoji = get_random_emoji(DASHBOARD_EMOJIS)
     st.header(f"{emoji} Dashboard")
@@ -1248,29 +1688,19 @@ def page_dashboard(username: str):
     my_income = float(income_means.get(username, 0.0))
 
     if items_df.empty:
-        my_debts = pd.DataFrame(columns=ITEMS_HEADERS)
-        my_credits = pd.DataFrame(columns=ITEMS_HEADERS)
+        my_debts = my_credits = _EMPTY_ITEMS_DF
+        total_owe = total_owed_to_me = 0.0
     else:
-        # Handle various boolean representations from Google Sheets
-        def is_unpaid(val):
-            if pd.isna(val):
-                return True
-            if isinstance(val, bool):
-                return not val
-            if isinstance(val, str):
-                return val.lower() not in ['true', '1', 'yes']
-            return not bool(val)
-        
-        unpaid_mask = items_df["paid"].apply(is_unpaid)
-        my_debts = items_df[
-            (items_df["debtor"] == username) & unpaid_mask
-        ]
-        my_credits = items_df[
-            (items_df["uploader"] == username) & unpaid_mask
-        ]
-
-    total_owe = float(my_debts["amount_owed"].sum()) if not my_debts.empty else 0.0
-    total_owed_to_me = float(my_credits["amount_owed"].sum()) if not my_credits.empty else 0.0
+        # One pass over the raw column arrays for both views; the totals
+        # come straight from the masked amounts
+        unpaid = ~items_df["paid"].to_numpy(dtype=bool)
+        debt_mask = unpaid & (items_df["debtor"].to_numpy() == username)
+        credit_mask = unpaid & (items_df["uploader"].to_numpy() == username)
+        amounts = items_df["amount_owed"].to_numpy(dtype=float)
+        total_owe = float(np.nansum(amounts[debt_mask]))
+        total_owed_to_me = float(np.nansum(amounts[credit_mask]))
+        my_debts = items_df[debt_mask]
+        my_credits = items_df[credit_mask]
 
     col1, col2, col3 = st.columns(3)
     col1.metric("My average income", f"{my_income:,.2f}")
@@ -1279,6 +1709,11 @@ def page_dashboard(username: str):
 
     st.subheader("💸 Debts I owe")
 
+    # Set just before the post-payment rerun, shown once on the next render
+    if "last_payment_msg" in st.session_state:
+        st.success(st.session_state.pop("last_payment_msg"))
+        st.info("Copied to archive and pending approval from the uploader.")
+
     if my_debts.empty:
         st.success(get_random_message(NO_DEBT_MESSAGES))
     else:
@@ -1288,39 +1723,37 @@ def page_dashboard(username: str):
         )
 
         with st.form("pay_debts_form"):
-            labels = []
-            values = []
-            for _, row in my_debts.iterrows():
-                label = (
-                    f"{row['description']} — you owe {row['amount_owed']:.2f} "
-                    f"to {row['uploader']} (id: {row['id']})"
+            # The widget's values are the debt ids; labels are display-only.
+            # id -> position in my_debts, so selections index straight into it
+            id_to_pos = {}
+            label_by_id = {}
+            for pos, row in enumerate(my_debts.itertuples(index=False)):
+                id_to_pos[row.id] = pos
+                label_by_id[row.id] = (
+                    f"{row.description} — you owe {row.amount_owed:.2f} "
+                    f"to {row.uploader} (id: {row.id})"
                 )
-                labels.append(label)
-                values.append(row["id"])
 
-            selected_labels = st.multiselect(
+            selected_ids = st.multiselect(
                 "Select items you are paying now:",
-                labels,
+                list(id_to_pos),
+                format_func=label_by_id.__getitem__,
             )
-            selected_ids = [
-                values[labels.index(lbl)] for lbl in selected_labels
-            ] if selected_labels else []
+            selected_pos = [id_to_pos[debt_id] for debt_id in selected_ids]
 
-            total_selected = float(
-                my_debts[my_debts["id"].isin(selected_ids)]["amount_owed"].sum()
-            ) if selected_ids else 0.0
+            amounts = my_debts["amount_owed"].to_numpy(dtype=float)
+            total_selected = float(np.nansum(amounts[selected_pos]))
 
             st.markdown(f"**Total to pay now:** {total_selected:,.2f}")
             submitted = st.form_submit_button("Mark selected as paid")
 
             if submitted:
-                if not selected_ids:
+                if not selected_pos:
                     st.warning("Select at least one item.")
                 else:
-                    mark_debts_as_paid(username, selected_ids)
-                    st.success(get_random_message(PAYMENT_MARKED_MESSAGES))
-                    st.info("Copied to archive and pending approval from the uploader.")
-                    st.rerun()
+                    mark_debts_as_paid(username, my_debts.iloc[selected_pos])
+                    st.session_state.last_payment_msg = get_random_message(PAYMENT_MARKED_MESSAGES)
+                    st.rerun(scope="fragment")
 
     st.subheader("💰 Debts others owe me")
 
@@ -1333,81 +1766,85 @@ def page_dashboard(username: str):
         )
     
     # Section to delete expenses
+    render_manage_expenses(username)
+
+
+@st.fragment
+def render_manage_expenses(username: str):
+    """
+    Delete section of the dashboard. Its own fragment, so ticking expenses in
+    the grid only reruns this section; a delete reruns the whole app since
+    the dashboard balances above change too.
+    """
     st.subheader("🗑️ Manage My Expenses")
     
-    # Get all unique expenses uploaded by this user (group by purchase_id)
-    my_expenses = items_df[items_df["uploader"] == username] if not items_df.empty else pd.DataFrame()
+    # Set just before the post-delete rerun, shown once on the next render
+    if "last_delete_msg" in st.session_state:
+        st.success(st.session_state.pop("last_delete_msg"))
     
-    if my_expenses.empty:
+    # One row per expense this user uploaded (cached per user)
+    expense_groups = load_expense_groups(username)
+    
+    if expense_groups.empty:
         st.info(get_random_message(NO_EXPENSES_MESSAGES))
-    else:
-        # Group by purchase_id to show unique expenses
-        expense_groups = my_expenses.groupby("purchase_id").agg({
-            "description": "first",
-            "amount_total": "first",
-            "purchase_date": "first",
-            "timestamp": "first",
-            "debtor": lambda x: list(x)
-        }).reset_index()
-        
-        # Bulk delete option
-        with st.expander("🗑️ Bulk Delete Expenses", expanded=False):
-            st.markdown("*Select multiple expenses to delete at once*")
-            
-            # Create checkboxes for each expense
-            selected_for_deletion = []
-            for _, expense in expense_groups.iterrows():
-                debtors = ", ".join(expense["debtor"])
-                label = f"**{expense['description']}** - ${expense['amount_total']:,.2f} (Shared with: {debtors})"
-                if st.checkbox(label, key=f"bulk_select_{expense['purchase_id']}"):
-                    selected_for_deletion.append(expense['purchase_id'])
-            
-            if selected_for_deletion:
-                col1, col2 = st.columns([1, 1])
-                with col1:
-                    st.metric("📊 Selected", len(selected_for_deletion))
-                with col2:
-                    selected_total = expense_groups[expense_groups['purchase_id'].isin(selected_for_deletion)]['amount_total'].sum()
-                    st.metric("💰 Total Amount", f"${selected_total:,.2f}")
-                
-                st.warning(f"⚠️ You are about to delete {len(selected_for_deletion)} expense(s). This action cannot be undone!")
-                
-                if st.button("🗑️ Delete Selected Expenses", type="primary", use_container_width=True):
-                    try:
-                        # Use batch delete - single API call for all deletions!
-                        deleted_count = batch_delete_expense_debts(username, selected_for_deletion)
-                        st.success(f"{get_random_message(DELETE_SUCCESS)} Deleted {deleted_count} expense(s)!")
-                    except Exception as e:
-                        st.error(f"Error deleting expenses: {str(e)}")
-                    
-                    st.rerun()
+        return
+    
+    st.markdown("*Tick the expenses you want to delete*")
+    
+    # One grid instead of a checkbox and a delete button per expense; only
+    # the tick column is editable. No key, so ticks reset when the rows change.
+    edited = st.data_editor(
+        expense_groups.assign(delete=False),
+        column_order=["delete", *MANAGE_EXPENSES_COLS],
+        column_config={
+            "delete": st.column_config.CheckboxColumn("Delete?"),
+            "description": "Description",
+            "amount_total": st.column_config.NumberColumn("Amount", format="$%.2f"),
+            "debtors": "Shared with",
+            "purchase_date": "Purchase date",
+            "timestamp": "Created",
+        },
+        disabled=MANAGE_EXPENSES_COLS,
+        hide_index=True,
+        use_container_width=True,
+    )
+    
+    selected = edited["delete"].to_numpy(dtype=bool)
+    if selected.any():
+        selected_for_deletion = expense_groups["purchase_id"].to_numpy()[selected].tolist()
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            st.metric("📊 Selected", len(selected_for_deletion))
+        with col2:
+            selected_total = np.nansum(expense_groups["amount_total"].to_numpy(dtype=float)[selected])
+            st.metric("💰 Total Amount", f"${selected_total:,.2f}")
         
-        st.markdown("---")
+        st.warning(f"⚠️ You are about to delete {len(selected_for_deletion)} expense(s). This action cannot be undone!")
         
-        # Individual delete options
-        st.write("**Your expenses:**")
-        for _, expense in expense_groups.iterrows():
-            debtors = ", ".join(expense["debtor"])
-            col1, col2 = st.columns([4, 1])
-            with col1:
-                st.write(f"**{expense['description']}** - ${expense['amount_total']:,.2f} (Shared with: {debtors})")
-                st.caption(f"Created: {expense['timestamp']} | Purchase date: {expense['purchase_date']}")
-            with col2:
-                if st.button("🗑️", key=f"delete_{expense['purchase_id']}", help="Delete this expense"):
-                    try:
-                        delete_expense_debts(username, expense["purchase_id"])
-                        st.success(f"{get_random_message(DELETE_SUCCESS)} ({expense['description']})")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"Error deleting expense: {str(e)}")
-            st.divider()
+        if st.button("🗑️ Delete Selected Expenses", type="primary", use_container_width=True):
+            try:
+                # Use batch delete - single API call for all deletions!
+                deleted_count = batch_delete_expense_debts(username, selected_for_deletion)
+            except Exception as e:
+                # No rerun, so the error stays on screen
+                st.error(f"Error deleting expenses: {str(e)}")
+            else:
+                st.session_state.last_delete_msg = (
+                    f"{get_random_message(DELETE_SUCCESS)} Deleted {deleted_count} expense(s)!"
+                )
+                st.rerun()
 
 
+@st.fragment
 def page_paychecks(username: str):
     emoji = get_random_emoji(PAYCHECK_EMOJIS)
     st.header(f"{emoji} My Paychecks")
     st.info(get_random_message(PAYCHECK_INTRO))
 
+    # Set just before the post-save rerun, shown once on the next render
+    if "last_paychecks_msg" in st.session_state:
+        st.success(st.session_state.pop("last_paychecks_msg"))
+
     df = load_paychecks_df()
     row = None
     if not df.empty and username in df["username"].values:
@@ -1446,19 +1883,24 @@ def page_paychecks(username: str):
 
         if submitted:
             upsert_paychecks(username, p1, p2, p3)
-            st.success("Paychecks saved.")
-            st.rerun()
+            st.session_state.last_paychecks_msg = "Paychecks saved."
+            st.rerun(scope="fragment")
 
     income_means = compute_income_means()
     my_income = float(income_means.get(username, 0.0))
     st.markdown(f"**Current average used for sharing:** {my_income:,.2f}")
 
 
+@st.fragment
 def page_add_expense(username: str):
     emoji = get_random_emoji(EXPENSE_EMOJIS)
     st.header(f"{emoji} Add New Expenses")
     st.info(get_random_message(EXPENSE_INTRO))
     
+    # Set just before the post-create rerun, shown once on the next render
+    if "last_expense_msg" in st.session_state:
+        st.success(st.session_state.pop("last_expense_msg"))
+    
     # Initialize session state for expenses
     if "expenses" not in st.session_state:
         st.session_state.expenses = [{"description": "", "amount": 0.0, "date": datetime.now().date()}]
@@ -1469,7 +1911,7 @@ def page_add_expense(username: str):
     with col1:
         share_label = st.radio(
             "How should expenses be shared?",
-            list(SHARE_TYPE_OPTIONS.keys()),
+            SHARE_TYPE_LABELS,
             index=1,
             help="This setting applies to all expenses below"
         )
@@ -1520,22 +1962,25 @@ def page_add_expense(username: str):
                 if st.button("🗑️", key=f"remove_{idx}", help="Remove this expense"):
                     expenses_to_remove.append(idx)
     
-    # Remove expenses marked for deletion
-    for idx in sorted(expenses_to_remove, reverse=True):
-        st.session_state.expenses.pop(idx)
-        st.rerun()
+    # Remove expenses marked for deletion in one pass, then rerun once
+    if expenses_to_remove:
+        removal_set = set(expenses_to_remove)
+        st.session_state.expenses = [
+            e for i, e in enumerate(st.session_state.expenses) if i not in removal_set
+        ]
+        st.rerun(scope="fragment")
     
     # Add more expense button
     col1, col2, col3 = st.columns([1, 1, 2])
     with col1:
         if st.button("➕ Add Another Expense", use_container_width=True):
             st.session_state.expenses.append({"description": "", "amount": 0.0, "date": datetime.now().date()})
-            st.rerun()
+            st.rerun(scope="fragment")
     
     with col2:
         if st.button("🔄 Clear All", use_container_width=True):
             st.session_state.expenses = [{"description": "", "amount": 0.0, "date": datetime.now().date()}]
-            st.rerun()
+            st.rerun(scope="fragment")
     
     st.divider()
     
@@ -1594,16 +2039,37 @@ def page_add_expense(username: str):
                             all_affected_users
                         )
                 
-                st.success(f"{get_random_message(EXPENSE_SUCCESS)} Created {success_count} expense(s)!")
+                st.session_state.last_expense_msg = (
+                    f"{get_random_message(EXPENSE_SUCCESS)} Created {success_count} expense(s)!"
+                )
                 
                 # Reset form
                 st.session_state.expenses = [{"description": "", "amount": 0.0, "date": datetime.now().date()}]
-                st.rerun()
+                st.rerun(scope="fragment")
                 
             except Exception as e:
                 st.error(f"Error creating expenses: {str(e)}")
-                import traceback
-                st.code(traceback.format_exc(), language="python")
+                with st.expander("Error details"):
+                    st.exception(e)
+
+
+def history_filter_mask(df: pd.DataFrame, username: str, filter_type: str, show_paid: bool) -> np.ndarray:
+    """Boolean row mask for the History page filters over one sheet's frame."""
+    uploader_arr = df["uploader"].to_numpy()
+    debtor_arr = df["debtor"].to_numpy()
+    mask = np.ones(len(df), dtype=bool)
+    if filter_type == "I uploaded":
+        mask &= uploader_arr == username
+    elif filter_type == "I owe":
+        mask &= debtor_arr == username
+    elif filter_type == "Others owe me":
+        mask &= (uploader_arr == username) & (debtor_arr != username)
+    
+    if not show_paid:
+        # "paid" is already parsed to bool by the loaders
+        mask &= ~df["paid"].to_numpy(dtype=bool)
+    
+    return mask
 
 
 def page_history(username: str):
@@ -1614,20 +2080,7 @@ def page_history(username: str):
     items_df = load_items_df()
     archive_df = load_archive_df()
     
-    # Combine items and archive
-    if not items_df.empty and not archive_df.empty:
-        # Add source column
-        items_df["source"] = "Active"
-        archive_df["source"] = "Archive"
-        # Combine, using only columns that exist in items
-        combined_df = pd.concat([items_df, archive_df[ITEMS_HEADERS + ["source"]]], ignore_index=True)
-    elif not items_df.empty:
-        items_df["source"] = "Active"
-        combined_df = items_df
-    elif not archive_df.empty:
-        archive_df["source"] = "Archive"
-        combined_df = archive_df[ITEMS_HEADERS + ["source"]]
-    else:
+    if items_df.empty and archive_df.empty:
         st.info(get_random_message(NO_HISTORY_MESSAGES))
         return
     
@@ -1641,40 +2094,37 @@ def page_history(username: str):
     with col2:
         show_paid = st.checkbox("Include paid items", value=True)
     
-    # Apply filters
-    filtered_df = combined_df.copy()
-    
-    if filter_type == "I uploaded":
-        filtered_df = filtered_df[filtered_df["uploader"] == username]
-    elif filter_type == "I owe":
-        filtered_df = filtered_df[filtered_df["debtor"] == username]
-    elif filter_type == "Others owe me":
-        filtered_df = filtered_df[
-            (filtered_df["uploader"] == username) & 
-            (filtered_df["debtor"] != username)
-        ]
-    
-    if not show_paid:
-        def is_unpaid(val):
-            if pd.isna(val):
-                return True
-            if isinstance(val, bool):
-                return not val
-            if isinstance(val, str):
-                return val.lower() not in ['true', '1', 'yes']
-            return not bool(val)
-        filtered_df = filtered_df[filtered_df["paid"].apply(is_unpaid)]
+    # Filter items and archive separately and combine only the matching rows,
+    # projected to the shared columns so archive-only columns are never copied
+    parts = []
+    # (codes index HISTORY_SOURCES)
+    for code, df in enumerate((items_df, archive_df)):
+        if df.empty:
+            continue
+        mask = history_filter_mask(df, username, filter_type, show_paid)
+        part = df.loc[mask, HISTORY_SOURCE_COLS]
+        parts.append(part.assign(
+            source=pd.Categorical.from_codes(np.full(len(part), code), categories=HISTORY_SOURCES)
+        ))
+    filtered_df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
     
     # Display
     if filtered_df.empty:
         st.info("No items match the selected filters. Try adjusting your filters! 🔍")
     else:
-        display_cols = [
-            "source", "timestamp", "purchase_date", "uploader", "debtor",
-            "description", "amount_total", "amount_owed", "paid", "share_type"
-        ]
+        if len(filtered_df) > HISTORY_TABLE_MAX_ROWS:
+            st.caption(
+                f"Showing the first {HISTORY_TABLE_MAX_ROWS} of {len(filtered_df)} items - "
+                "download the CSV for the full list."
+            )
+            st.download_button(
+                "⬇️ Download CSV",
+                filtered_df[HISTORY_DISPLAY_COLS].to_csv(index=False).encode("utf-8"),
+                file_name="history.csv",
+                mime="text/csv",
+            )
         st.dataframe(
-            filtered_df[display_cols],
+            filtered_df[HISTORY_DISPLAY_COLS].head(HISTORY_TABLE_MAX_ROWS),
             use_container_width=True,
         )
         
@@ -1686,119 +2136,90 @@ def page_history(username: str):
             st.metric("💵 Total Amount", f"{total_amount:,.2f}")
 
 
+@st.fragment
 def page_approve(username: str):
     emoji = get_random_emoji(APPROVE_EMOJIS)
     st.header(f"{emoji} Approve Payments")
     st.info(get_random_message(APPROVAL_INTRO))
 
-    archive_df = load_archive_df()
-    if archive_df.empty:
-        st.success(get_random_message(NO_APPROVALS_MESSAGES))
-        return
-    
-    # Handle boolean values properly
-    def is_approved(val):
-        if pd.isna(val):
-            return False
-        if isinstance(val, bool):
-            return val
-        if isinstance(val, str):
-            return val.lower() in ['true', '1', 'yes']
-        return bool(val)
-    
-    def is_paid(val):
-        if pd.isna(val):
-            return False
-        if isinstance(val, bool):
-            return val
-        if isinstance(val, str):
-            return val.lower() in ['true', '1', 'yes']
-        return bool(val)
-
-    pending = archive_df[
-        (archive_df["uploader"] == username)
-        & (~archive_df["approved"].apply(is_approved))
-        & (archive_df["paid"].apply(is_paid))
-    ]
+    # Set just before the post-approval rerun, shown once on the next render
+    if "last_approval_msg" in st.session_state:
+        st.success(st.session_state.pop("last_approval_msg"))
 
+    pending = load_pending_approvals(username)
     if pending.empty:
-        st.success(get_random_message(NO_APPROVALS_MESSAGES))
+        # Picked once and kept until there is something to approve again
+        if "approve_empty_msg" not in st.session_state:
+            st.session_state.approve_empty_msg = get_random_message(NO_APPROVALS_MESSAGES)
+        st.success(st.session_state.approve_empty_msg)
         return
+    st.session_state.pop("approve_empty_msg", None)
 
     st.info("💡 These payments were marked as paid by other users. Review and approve them below:")
 
-    st.dataframe(
-        pending[
-            [
-                "id",
-                "debtor",
-                "description",
-                "amount_owed",
-                "paid_by",
-                "paid_at",
-                "purchase_date",
-            ]
-        ],
-        use_container_width=True,
-    )
-
-    with st.form("approve_payments_form"):
-        labels = []
-        values = []
-        for _, row in pending.iterrows():
-            label = (
-                f"{row['debtor']} / {row['paid_by']} paid {row['amount_owed']:.2f} "
-                f"for '{row['description']}' (id: {row['id']})"
-            )
-            labels.append(label)
-            values.append(row["id"])
+    if "approve_warning" in st.session_state:
+        st.warning(st.session_state.pop("approve_warning"))
+
+    with st.form("approve_payments_form", clear_on_submit=True):
+        # The table doubles as the selection widget: only the checkbox column
+        # is editable, and it keeps pending's index for approve_payments.
+        # clear_on_submit drops the ticks once they have been acted on.
+        st.data_editor(
+            pending.loc[:, APPROVE_DISPLAY_COLS]
+            .astype({"debtor": "category", "paid_by": "category"})
+            .assign(approve=False),
+            column_order=["approve", *APPROVE_DISPLAY_COLS],
+            column_config={"approve": st.column_config.CheckboxColumn("Approve?")},
+            disabled=APPROVE_DISPLAY_COLS,
+            hide_index=True,
+            use_container_width=True,
+            key="approve_editor",
+        )
 
-        selected_labels = st.multiselect(
-            "Select payments to approve:",
-            labels,
+        # The fragment reruns after the callback, so no explicit st.rerun
+        st.form_submit_button(
+            "Approve selected",
+            on_click=_approve_selected,
+            args=(username, pending),
         )
-        selected_ids = [
-            values[labels.index(lbl)] for lbl in selected_labels
-        ] if selected_labels else []
 
-        submitted = st.form_submit_button("Approve selected")
 
-        if submitted:
-            if not selected_ids:
-                st.warning("Select at least one row to approve.")
-                return
+def _approve_selected(username: str, pending: pd.DataFrame):
+    """Submit callback for the approval form: approve the ticked rows."""
+    edited_rows = st.session_state["approve_editor"]["edited_rows"]
+    positions = sorted(int(pos) for pos, edits in edited_rows.items() if edits.get("approve"))
+    if not positions:
+        st.session_state.approve_warning = "Select at least one row to approve."
+        return
 
-            approve_payments(username, selected_ids)
-            st.success(get_random_message(APPROVAL_SUCCESS))
-            st.rerun()
+    approve_payments(username, pending.iloc[positions])
+    st.session_state.last_approval_msg = get_random_message(APPROVAL_SUCCESS)
 
 
 # -------------------------------------------------------------------
 # MAIN APP
 # -------------------------------------------------------------------
 
+# Sidebar label -> page renderer, in navigation order
+PAGES = {
+    "Dashboard": page_dashboard,
+    "Update paychecks": page_paychecks,
+    "Add expense": page_add_expense,
+    "Approve payments": page_approve,
+    "History": page_history,
+}
+
+
 def main():
     username = require_login()
 
     st.sidebar.header("Navigation")
-    page = st.sidebar.radio(
-        "Go to",
-        ["Dashboard", "Update paychecks", "Add expense", "Approve payments", "History"],
-    )
+    page = st.sidebar.radio("Go to", list(PAGES))
     
     st.sidebar.markdown("---")
     st.sidebar.markdown("💡 **Tip:** You can delete expenses you created from the Dashboard!")
 
-    if page == "Dashboard":
-        page_dashboard(username)
-    elif page == "Update paychecks":
-        page_paychecks(username)
-    elif page == "Add expense":
-        page_add_expense(username)
-    elif page == "Approve payments":
-        page_approve(username)
-    elif page == "History":
-        page_history(username)
+    PAGES[page](username)
 
 
 if __name__ == "__main__":